@@ -29,6 +29,7 @@
     ],
     'data': [
         'security/ir.model.access.csv',
+        'data/queue_job_data.xml',
         'views/whatsapp_gateway_views.xml',
         'views/whatsapp_gateway_log_views.xml',
         'views/whatsapp_template_views.xml',
@@ -1,4 +1,4 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, _
 
 
 class CrmLead(models.Model):
@@ -8,14 +8,16 @@ class CrmLead(models.Model):
     whatsapp_log_count = fields.Integer(string='WhatsApp Messages',
                                        compute='_compute_whatsapp_log_count')
 
-    @api.depends()
     def _compute_whatsapp_log_count(self):
         """Compute the number of WhatsApp messages sent for this lead"""
+        groups = self.env['whatsapp.gateway.log']._read_group(
+            [('res_model', '=', 'crm.lead'), ('res_id', 'in', self.ids)],
+            groupby=['res_id'],
+            aggregates=['__count'],
+        )
+        counts = dict(groups)
         for lead in self:
-            lead.whatsapp_log_count = self.env['whatsapp.gateway.log'].search_count([
-                ('res_model', '=', 'crm.lead'),
-                ('res_id', '=', lead.id)
-            ])
+            lead.whatsapp_log_count = counts.get(lead.id, 0)
 
     def action_send_whatsapp(self):
         """Action to send WhatsApp message for lead"""
@@ -1,4 +1,4 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, _
 
 
 class ResPartner(models.Model):
@@ -10,14 +10,16 @@ class ResPartner(models.Model):
     whatsapp_log_count = fields.Integer(string='WhatsApp Messages',
                                        compute='_compute_whatsapp_log_count')
 
-    @api.depends()
     def _compute_whatsapp_log_count(self):
         """Compute the number of WhatsApp messages sent to this partner"""
+        groups = self.env['whatsapp.gateway.log']._read_group(
+            [('res_model', '=', 'res.partner'), ('res_id', 'in', self.ids)],
+            groupby=['res_id'],
+            aggregates=['__count'],
+        )
+        counts = dict(groups)
         for partner in self:
-            partner.whatsapp_log_count = self.env['whatsapp.gateway.log'].search_count([
-                ('res_model', '=', 'res.partner'),
-                ('res_id', '=', partner.id)
-            ])
+            partner.whatsapp_log_count = counts.get(partner.id, 0)
 
     def action_send_whatsapp(self):
         """Action to send WhatsApp message to partner"""
@@ -1,18 +1,165 @@
 import json
 import logging
+import os
+import re
+import threading
+from collections import defaultdict
 import requests
-from odoo import models, fields, api, _
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError, MaxRetryError, NewConnectionError
+from urllib3.util.retry import Retry
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.addons.queue_job.exception import RetryableJobError
 from odoo.addons.queue_job.job import job
 
 _logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Keep-alive HTTP sessions, one per worker process and gateway, with the
+# fingerprint of the configuration they were created for
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+_NON_DIGIT = re.compile(r'\D+')
+
+# (connect, read) timeouts in seconds, short enough that a dead gateway
+# does not hold a channel slot for long
+REQUEST_TIMEOUT = (3, 10)
+
+# Bytes of a gateway response body kept in the logs
+RESPONSE_BODY_LIMIT = 4096
+
+# queue_job channel of the send jobs, by gateway type
+_JOB_CHANNELS = {
+    'external_rest': 'root.whatsapp.external',
+    'meta_cloud_api': 'root.whatsapp.meta',
+}
+
+# Constant part of a Meta Cloud API text message
+_META_TEXT_PAYLOAD = {
+    'messaging_product': 'whatsapp',
+    'type': 'text',
+}
+
+
+def _get_http_session(key, headers, pool_size):
+    """
+    Return the keep-alive HTTP session cached for ``key`` with ``headers``
+    
+    A gateway has a single session per worker process: when its headers or
+    pool size change, e.g. on a token rotation, the previous session is
+    closed and replaced.
+    """
+    key = (os.getpid(), key)
+    fingerprint = (tuple(sorted(headers.items())), pool_size)
+    cached = _SESSIONS.get(key)
+    if cached is None or cached[0] != fingerprint:
+        with _SESSIONS_LOCK:
+            cached = _SESSIONS.get(key)
+            if cached is None or cached[0] != fingerprint:
+                session = requests.Session()
+                # Only failures to connect are retried: both GET and POST
+                # requests send a message, so a request that reached the
+                # gateway is never resent, whatever its response
+                retry = Retry(connect=3, read=0, status=0, other=0, backoff_factor=0.5)
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                      max_retries=retry)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update(headers)
+                if cached is not None:
+                    cached[1].close()
+                cached = _SESSIONS[key] = (fingerprint, session)
+    return cached[1]
+
+
+def _read_response(response):
+    """
+    Check a streamed gateway response and read its body, capped to RESPONSE_BODY_LIMIT
+    
+    The connection goes back to the keep-alive pool when the body was read
+    entirely; a larger body is not downloaded and its connection is dropped.
+    Errors of urllib3 while reading the body are raised as a requests
+    ConnectionError, like requests does for the bodies it reads itself.
+    """
+    try:
+        response.raise_for_status()
+        content = response.raw.read(RESPONSE_BODY_LIMIT + 1, decode_content=True)
+    except Urllib3HTTPError as e:
+        response.close()
+        raise requests.exceptions.ConnectionError(e, request=response.request, response=response) from e
+    except Exception:
+        response.close()
+        raise
+    
+    if len(content) > RESPONSE_BODY_LIMIT:
+        response.close()
+        body = content[:RESPONSE_BODY_LIMIT].decode(response.encoding or 'utf-8', errors='replace')
+        body += ' [truncated]'
+    else:
+        response.raw.release_conn()
+        body = content.decode(response.encoding or 'utf-8', errors='replace')
+    
+    return {
+        'status_code': response.status_code,
+        'response_body': body,
+        'success': True
+    }
+
+
+def _is_connect_error(error):
+    """
+    Whether a requests error happened before the request was sent
+    
+    Read timeouts and connections dropped after sending are not: the gateway
+    may have accepted the message already.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = error.args[0]
+        if isinstance(reason, MaxRetryError):
+            reason = reason.reason
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+def _get_pool_size(env):
+    """Connections kept per gateway, should cover the root.whatsapp channel capacity"""
+    return int(env['ir.config_parameter'].sudo().get_param('whatsapp.pool_size', 64))
+
+
+def _substitute_placeholders(value, replacements):
+    """Recursively replace placeholders in the strings of a parsed JSON template"""
+    if isinstance(value, str):
+        for placeholder, replacement in replacements:
+            if placeholder in value:
+                value = value.replace(placeholder, replacement)
+        return value
+    if isinstance(value, dict):
+        return {
+            _substitute_placeholders(key, replacements): _substitute_placeholders(item, replacements)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_substitute_placeholders(item, replacements) for item in value]
+    return value
+
 
 class WhatsAppGateway(models.Model):
     """Abstract base class for WhatsApp gateways"""
     _name = 'whatsapp.gateway'
     _description = 'WhatsApp Gateway'
     _order = 'name'
+    
+    # Attempts before a send job failing on network errors is given up,
+    # retries are spaced by the retry pattern of data/queue_job_data.xml
+    _job_max_retries = 5
 
     name = fields.Char(string='Gateway Name', required=True)
     type = fields.Selection([
@@ -24,13 +171,16 @@ class WhatsAppGateway(models.Model):
     # Computed fields
     log_count = fields.Integer(string='Log Count', compute='_compute_log_count')
     
-    @api.depends()
     def _compute_log_count(self):
-        """Compute the number of logs for this gateway"""
+        """Compute the number of logs of the gateways with one indexed GROUP BY"""
+        groups = self.env['whatsapp.gateway.log']._read_group(
+            [('gateway_id', 'in', self.ids)],
+            groupby=['gateway_id'],
+            aggregates=['__count'],
+        )
+        counts = {gateway.id: count for gateway, count in groups}
         for gateway in self:
-            gateway.log_count = self.env['whatsapp.gateway.log'].search_count([
-                ('gateway_id', '=', gateway.id)
-            ])
+            gateway.log_count = counts.get(gateway.id, 0)
     
     def action_view_logs(self):
         """Action to view gateway logs"""
@@ -54,14 +204,7 @@ class WhatsAppGateway(models.Model):
             phone_number = self._clean_phone_number(phone_number)
             
             # Dispatch to specific gateway implementation
-            if self.type == 'external_rest':
-                gateway = self.env['whatsapp.external.gateway'].browse(self.id)
-                response = gateway._send_external_message(message, phone_number)
-            elif self.type == 'meta_cloud_api':
-                gateway = self.env['whatsapp.meta.gateway'].browse(self.id)
-                response = gateway._send_meta_message(message, phone_number)
-            else:
-                raise UserError(_('Unknown gateway type: %s') % self.type)
+            response = self._send_message(message, phone_number)
             
             # Log success
             self._log_message(message, phone_number, 'success', 
@@ -86,16 +229,137 @@ class WhatsAppGateway(models.Model):
             # Write error to chatter
             if model and res_id:
                 self._write_to_chatter(model, res_id, message, phone_number, False, str(e))
+            
+            # Let queue_job retry with backoff when the gateway could not be
+            # reached, the message was not sent so it cannot be duplicated
+            if _is_connect_error(e.__cause__):
+                raise RetryableJobError(str(e)) from e
                 
             raise
     
+    @job(channel='root.whatsapp')
+    def send_whatsapp_batch(self, messages):
+        """
+        Send a batch of WhatsApp messages in a single job
+        
+        A failed message is logged and does not interrupt the batch, so that
+        retrying the job never resends the messages that already went out.
+        
+        Args:
+            messages: List of dicts with 'message', 'phone_number' and
+                optional 'model' and 'res_id' keys. When a 'log_id' is given,
+                the message is a retry and that log is updated in place.
+            
+        Returns:
+            int: Number of messages sent successfully
+        """
+        log_buffer = []
+        retried_logs = {}
+        gateway = self.with_context(whatsapp_log_buffer=log_buffer)
+        sent = 0
+        for values in messages:
+            message = values['message']
+            phone_number = values['phone_number']
+            model = values.get('model')
+            res_id = values.get('res_id')
+            try:
+                phone_number = gateway._clean_phone_number(phone_number)
+                response = gateway._send_message(message, phone_number)
+            except Exception as e:
+                _logger.error('WhatsApp batch send error: %s', str(e))
+                gateway._log_message(message, phone_number, 'error',
+                                     getattr(e, 'status_code', 500), str(e), model, res_id)
+                if model and res_id:
+                    gateway._write_to_chatter(model, res_id, message, phone_number, False, str(e))
+            else:
+                sent += 1
+                gateway._log_message(message, phone_number, 'success',
+                                     response.get('status_code', 200),
+                                     response.get('response_body', ''), model, res_id)
+                if model and res_id:
+                    gateway._write_to_chatter(model, res_id, message, phone_number, True)
+            
+            if values.get('log_id'):
+                retried_logs[values['log_id']] = log_buffer.pop()
+        
+        # Flush all the buffered log entries in a single INSERT
+        self.env['whatsapp.gateway.log']._insert_logs_sql(log_buffer)
+        self._update_retried_logs(retried_logs)
+        return sent
+    
+    def _update_retried_logs(self, retried_logs):
+        """Record the outcome of retried messages on their original logs"""
+        Log = self.env['whatsapp.gateway.log']
+        for log_id, vals in retried_logs.items():
+            Log.browse(log_id).write({
+                'status': vals['status'],
+                'response_code': vals['response_code'],
+                'response_body': vals['response_body'],
+                'timestamp': fields.Datetime.now(),
+            })
+    
+    def _enqueue_whatsapp_batches(self, messages, batch_size=None):
+        """
+        Split messages into batches and enqueue one send_whatsapp_batch job per batch
+        
+        Args:
+            messages: List of message dicts, see send_whatsapp_batch
+            batch_size: Messages per job, defaults to the whatsapp.batch_size
+                system parameter (20)
+            
+        Returns:
+            list: The enqueued jobs
+        """
+        self.ensure_one()
+        if not batch_size:
+            batch_size = int(self.env['ir.config_parameter'].sudo().get_param('whatsapp.batch_size', 20))
+        return [
+            self._with_delay().send_whatsapp_batch(messages[index:index + batch_size])
+            for index in range(0, len(messages), batch_size)
+        ]
+    
+    def _with_delay(self, **kwargs):
+        """Delay a send job on the channel of the gateway type, with the gateway retry policy"""
+        kwargs.setdefault('max_retries', self._job_max_retries)
+        kwargs.setdefault('channel', _JOB_CHANNELS.get(self.type, 'root.whatsapp'))
+        return self.with_delay(**kwargs)
+    
+    def _send_message(self, message, phone_number):
+        """Dispatch a message to the gateway implementation matching its type"""
+        if self.type == 'external_rest':
+            gateway = self._get_implementation('whatsapp.external.gateway')
+            return gateway._send_external_message(message, phone_number)
+        elif self.type == 'meta_cloud_api':
+            gateway = self._get_implementation('whatsapp.meta.gateway')
+            return gateway._send_meta_message(message, phone_number)
+        raise UserError(_('Unknown gateway type: %s') % self.type)
+    
+    def _get_implementation(self, model_name):
+        """Return the record of ``model_name`` delegating to this gateway"""
+        return self.env[model_name].browse(self._get_implementation_id(model_name))
+    
+    @tools.ormcache('self.id', 'model_name')
+    def _get_implementation_id(self, model_name):
+        """
+        Id of the implementation record, which never changes for a gateway
+        
+        A gateway without implementation record raises instead of caching
+        the missing record, so that it can still be configured afterwards.
+        """
+        implementation = self.env[model_name].with_context(active_test=False).search(
+            [('gateway_id', '=', self.id)], limit=1)
+        if not implementation:
+            raise UserError(_('No configuration found for gateway %s') % self.name)
+        return implementation.id
+    
+    @api.model
     def _clean_phone_number(self, phone_number):
         """Clean and format phone number"""
         if not phone_number:
             raise UserError(_('Phone number is required'))
         
         # Remove common separators and spaces
-        cleaned = ''.join(filter(str.isdigit, phone_number))
+        cleaned = _NON_DIGIT.sub('', phone_number)
         
         # Add international prefix if missing
         if not cleaned.startswith('39') and len(cleaned) == 10:  # Italian numbers
@@ -106,8 +370,23 @@ class WhatsAppGateway(models.Model):
         return cleaned
     
     def _log_message(self, message, phone_number, status, response_code, response_body, model=None, res_id=None):
-        """Create log entry for message"""
-        self.env['whatsapp.gateway.log'].create({
+        """
+        Create log entry for message
+        
+        When a list is provided as 'whatsapp_log_buffer' in the context, the
+        values are appended to it instead, for the caller to create them in batch.
+        """
+        vals = self._prepare_log_values(message, phone_number, status, response_code,
+                                        response_body, model, res_id)
+        log_buffer = self.env.context.get('whatsapp_log_buffer')
+        if log_buffer is not None:
+            log_buffer.append(vals)
+            return
+        self.env['whatsapp.gateway.log'].create(vals)
+    
+    def _prepare_log_values(self, message, phone_number, status, response_code, response_body, model=None, res_id=None):
+        """Prepare the whatsapp.gateway.log values for a message"""
+        return {
             'gateway_id': self.id,
             'type': self.type,
             'message': message,
@@ -117,27 +396,100 @@ class WhatsAppGateway(models.Model):
             'response_body': response_body,
             'res_model': model,
             'res_id': res_id,
-        })
+        }
     
     def _write_to_chatter(self, model, res_id, message, phone_number, success, error_msg=None):
-        """Write message to record chatter"""
-        try:
-            record = self.env[model].browse(res_id)
-            if record.exists():
-                if success:
-                    body = _('WhatsApp message sent to %s: %s') % (phone_number, message)
-                    subtype_xmlid = 'mail.mt_note'
-                else:
-                    body = _('WhatsApp message failed to %s: %s\nError: %s') % (phone_number, message, error_msg)
-                    subtype_xmlid = 'mail.mt_comment'
+        """
+        Write message to record chatter
+        
+        The message is only queued here: all the messages of the transaction
+        are posted together once it is committed, off the send path.
+        """
+        if success:
+            body = _('WhatsApp message sent to %s: %s') % (phone_number, message)
+        else:
+            body = _('WhatsApp message failed to %s: %s\nError: %s') % (phone_number, message, error_msg)
+        
+        postcommit = self.env.cr.postcommit
+        entries = postcommit.data.get('whatsapp.chatter')
+        if entries is None:
+            entries = postcommit.data['whatsapp.chatter'] = []
+            registry = self.env.registry
+            uid = self.env.uid
+            author_id = self.env.user.partner_id.id
+            postcommit.add(lambda: _post_chatter_messages(registry, uid, author_id, entries))
+        entries.append((model, res_id, body, success))
+
+
+def _post_chatter_messages(registry, uid, author_id, entries):
+    """Post the queued WhatsApp chatter messages in a new transaction"""
+    entries_by_model = defaultdict(list)
+    for model, res_id, body, success in entries:
+        entries_by_model[model].append((res_id, body, success))
+    
+    try:
+        with registry.cursor() as cr:
+            env = api.Environment(cr, uid, {'mail_notify_force_send': False})
+            for model, model_entries in entries_by_model.items():
+                if model not in env or not hasattr(env[model], '_message_log_batch'):
+                    _logger.warning('Failed to write to chatter: %s has no chatter', model)
+                    continue
+                records = env[model].browse({res_id for res_id, _body, _success in model_entries})
+                existing_ids = set(records.exists().ids)
+                
+                # Successful sends are logged as notes, in batches of distinct records
+                notes = [(res_id, body) for res_id, body, success in model_entries
+                         if success and res_id in existing_ids]
+                while notes:
+                    bodies, duplicates = {}, []
+                    for res_id, body in notes:
+                        if res_id in bodies:
+                            duplicates.append((res_id, body))
+                        else:
+                            bodies[res_id] = body
+                    _log_chatter_notes(env[model], bodies, author_id)
+                    notes = duplicates
                 
-                record.message_post(
-                    body=body,
-                    subtype_xmlid=subtype_xmlid,
-                    author_id=self.env.user.partner_id.id,
-                )
+                # Failures are posted as comments so that followers are notified
+                for res_id, body, success in model_entries:
+                    if not success and res_id in existing_ids:
+                        try:
+                            with cr.savepoint():
+                                env[model].browse(res_id).message_post(
+                                    body=body,
+                                    subtype_xmlid='mail.mt_comment',
+                                    author_id=author_id,
+                                )
+                        except Exception as e:
+                            _logger.warning('Failed to write to chatter of %s,%s: %s', model, res_id, str(e))
+    except Exception as e:
+        _logger.warning('Failed to write to chatter: %s', str(e))
+
+
+def _log_chatter_notes(model, bodies, author_id):
+    """
+    Log notes on distinct records of ``model``, ``bodies`` being keyed by record id
+    
+    The notes are logged in one batch; when the batch fails, e.g. on a record
+    the user cannot access, they are logged one at a time so that only the
+    failing records lose their note.
+    """
+    cr = model.env.cr
+    try:
+        with cr.savepoint():
+            model.browse(list(bodies))._message_log_batch(bodies=bodies, author_id=author_id)
+        return
+    except Exception as e:
+        if len(bodies) == 1:
+            _logger.warning('Failed to write to chatter of %s,%s: %s', model._name, next(iter(bodies)), str(e))
+            return
+    
+    for res_id, body in bodies.items():
+        try:
+            with cr.savepoint():
+                model.browse(res_id)._message_log_batch(bodies={res_id: body}, author_id=author_id)
         except Exception as e:
-            _logger.warning('Failed to write to chatter: %s', str(e))
+            _logger.warning('Failed to write to chatter of %s,%s: %s', model._name, res_id, str(e))
 
 
 class WhatsAppExternalGateway(models.Model):
@@ -193,30 +545,36 @@ class WhatsAppExternalGateway(models.Model):
                 except json.JSONDecodeError:
                     raise ValidationError(_('Parameters template must be valid JSON'))
     
+    @api.model
+    @tools.ormcache('params_template')
+    def _parse_params_template(self, params_template):
+        """Parse a parameters template once; the result is shared and must not be mutated"""
+        return json.loads(params_template)
+    
+    def _get_session(self):
+        """Return the keep-alive HTTP session carrying the configured headers"""
+        headers = {'Content-Type': 'application/json'}
+        if self.headers:
+            try:
+                headers.update(json.loads(self.headers))
+            except json.JSONDecodeError:
+                _logger.warning('Invalid headers JSON for gateway %s', self.name)
+        return _get_http_session((self.env.cr.dbname, self._name, self.id), headers,
+                                 _get_pool_size(self.env))
+    
     def _send_external_message(self, message, phone_number):
         """Send message through external REST API"""
         try:
-            # Prepare headers
-            headers = {'Content-Type': 'application/json'}
-            if self.headers:
-                try:
-                    custom_headers = json.loads(self.headers)
-                    headers.update(custom_headers)
-                except json.JSONDecodeError:
-                    _logger.warning('Invalid headers JSON for gateway %s', self.name)
-            
             # Prepare parameters
             params = {}
             if self.params_template:
                 try:
-                    template = json.loads(self.params_template)
+                    template = self._parse_params_template(self.params_template)
                     # Replace placeholders
-                    params_str = json.dumps(template)
-                    params_str = params_str.replace('{phone}', phone_number)
-                    params_str = params_str.replace('{message}', message)
-                    if self.api_key_value and '{api_key}' in params_str:
-                        params_str = params_str.replace('{api_key}', self.api_key_value)
-                    params = json.loads(params_str)
+                    replacements = [('{phone}', phone_number), ('{message}', message)]
+                    if self.api_key_value:
+                        replacements.append(('{api_key}', self.api_key_value))
+                    params = _substitute_placeholders(template, replacements)
                 except json.JSONDecodeError:
                     _logger.warning('Invalid params template for gateway %s', self.name)
             
@@ -229,22 +587,17 @@ class WhatsAppExternalGateway(models.Model):
                 params[self.api_key_param] = self.api_key_value
             
             # Make HTTP request
+            session = self._get_session()
             if self.method == 'GET':
-                response = requests.get(self.url, params=params, headers=headers, timeout=30)
+                response = session.get(self.url, params=params, timeout=REQUEST_TIMEOUT, stream=True)
             else:
-                response = requests.post(self.url, json=params, headers=headers, timeout=30)
-            
-            response.raise_for_status()
+                response = session.post(self.url, json=params, timeout=REQUEST_TIMEOUT, stream=True)
             
-            return {
-                'status_code': response.status_code,
-                'response_body': response.text,
-                'success': True
-            }
+            return _read_response(response)
             
         except requests.exceptions.RequestException as e:
             _logger.error('External gateway request failed: %s', str(e))
-            raise UserError(_('Failed to send WhatsApp message: %s') % str(e))
+            raise UserError(_('Failed to send WhatsApp message: %s') % str(e)) from e
 
 
 class WhatsAppMetaGateway(models.Model):
@@ -264,7 +617,7 @@ class WhatsAppMetaGateway(models.Model):
                              help='Business name displayed to recipients')
     
     endpoint_template = fields.Char(string='API Endpoint', 
-                                   compute='_compute_endpoint_template',
+                                   compute='_compute_endpoint_template', store=True,
                                    help='Generated API endpoint URL')
     
     @api.depends('phone_number_id')
@@ -282,44 +635,35 @@ class WhatsAppMetaGateway(models.Model):
         vals['type'] = 'meta_cloud_api'
         return super().create(vals)
     
+    def _get_session(self):
+        """Return the keep-alive HTTP session authenticated with the access token"""
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+            'Content-Type': 'application/json',
+        }
+        return _get_http_session((self.env.cr.dbname, self._name, self.id), headers,
+                                 _get_pool_size(self.env))
+    
     def _send_meta_message(self, message, phone_number):
         """Send message through Meta Cloud API"""
         try:
             # Remove + from phone number for Meta API
             clean_phone = phone_number.lstrip('+')
             
-            # Prepare headers
-            headers = {
-                'Authorization': f'Bearer {self.access_token}',
-                'Content-Type': 'application/json',
-            }
-            
             # Prepare payload according to Meta API spec
-            payload = {
-                'messaging_product': 'whatsapp',
-                'to': clean_phone,
-                'type': 'text',
-                'text': {
-                    'body': message
-                }
-            }
+            payload = {**_META_TEXT_PAYLOAD, 'to': clean_phone, 'text': {'body': message}}
             
-            # Make API request
-            response = requests.post(
-                self.endpoint_template,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            
-            response.raise_for_status()
+            # Make API request, the session already sends the JSON content type
+            session = self._get_session()
+            if orjson is not None:
+                response = session.post(self.endpoint_template, data=orjson.dumps(payload),
+                                        timeout=REQUEST_TIMEOUT, stream=True)
+            else:
+                response = session.post(self.endpoint_template, json=payload,
+                                        timeout=REQUEST_TIMEOUT, stream=True)
             
-            return {
-                'status_code': response.status_code,
-                'response_body': response.text,
-                'success': True
-            }
+            return _read_response(response)
             
         except requests.exceptions.RequestException as e:
             _logger.error('Meta gateway request failed: %s', str(e))
-            raise UserError(_('Failed to send WhatsApp message via Meta: %s') % str(e))
\ No newline at end of file
+            raise UserError(_('Failed to send WhatsApp message via Meta: %s') % str(e)) from e
\ No newline at end of file
@@ -1,4 +1,8 @@
-from odoo import models, fields, api, _
+from collections import defaultdict
+
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import AccessError
+from odoo.tools import SQL
 
 
 class WhatsAppGatewayLog(models.Model):
@@ -8,7 +12,8 @@ class WhatsAppGatewayLog(models.Model):
     _order = 'timestamp desc'
     _rec_name = 'phone_number'
 
-    gateway_id = fields.Many2one('whatsapp.gateway', string='Gateway', required=True, ondelete='cascade')
+    gateway_id = fields.Many2one('whatsapp.gateway', string='Gateway', required=True, ondelete='cascade',
+                                 index=True)
     type = fields.Selection([
         ('external_rest', 'External REST API'),
         ('meta_cloud_api', 'Meta Cloud API'),
@@ -20,32 +25,94 @@ class WhatsAppGatewayLog(models.Model):
     status = fields.Selection([
         ('success', 'Success'),
         ('error', 'Error'),
+        ('retrying', 'Retrying'),
     ], string='Status', required=True)
+    retry_count = fields.Integer(string='Retries', default=0, readonly=True,
+                                 help='Number of times the message was queued again after failing')
+    retry_job_uuid = fields.Char(string='Retry Job', readonly=True, copy=False,
+                                 help='UUID of the queue job retrying the message')
     
     response_code = fields.Char(string='Response Code')
     response_body = fields.Text(string='Response Body')
-    timestamp = fields.Datetime(string='Timestamp', default=fields.Datetime.now, required=True)
+    timestamp = fields.Datetime(string='Timestamp', default=fields.Datetime.now, required=True,
+                                index=True)
     
     # Optional link to source record
     res_model = fields.Char(string='Source Model')
-    res_id = fields.Integer(string='Source Record ID')
+    res_id = fields.Integer(string='Source Record ID', index=True)
     res_name = fields.Char(string='Source Record', compute='_compute_res_name', store=True)
     
+    def init(self):
+        """Create the composite index used by the per-record log lookups"""
+        tools.create_index(self.env.cr, 'whatsapp_gateway_log_res_model_res_id_idx',
+                           self._table, ['res_model', 'res_id'])
+    
+    @api.model
+    def _insert_logs_sql(self, vals_list):
+        """
+        Insert log entries with a single SQL statement, bypassing the ORM
+        
+        Meant for bulk sends: the statement only inserts the logs, res_name is
+        computed as create() does, but no create() override is called.
+        
+        Args:
+            vals_list: List of dicts as returned by whatsapp.gateway._prepare_log_values
+            
+        Returns:
+            whatsapp.gateway.log: The inserted logs
+        """
+        if not vals_list:
+            return self.browse()
+        
+        now = fields.Datetime.now()
+        uid = self.env.uid
+        rows = SQL(", ").join(
+            SQL(
+                "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                vals['gateway_id'], vals['type'], vals['message'], vals['phone_number'],
+                vals['status'], vals.get('response_code') or None, vals.get('response_body') or None,
+                vals.get('res_model') or None, int(vals.get('res_id') or 0),
+                vals.get('timestamp') or now, 0, uid, now, uid, now,
+            )
+            for vals in vals_list
+        )
+        self.env.cr.execute(SQL("""
+            INSERT INTO whatsapp_gateway_log (
+                gateway_id, type, message, phone_number,
+                status, response_code, response_body,
+                res_model, res_id,
+                timestamp, retry_count, create_uid, create_date, write_uid, write_date
+            ) VALUES %s
+            RETURNING id
+        """, rows))
+        logs = self.browse(row[0] for row in self.env.cr.fetchall())
+        self.env.add_to_compute(self._fields['res_name'], logs)
+        return logs
+    
     @api.depends('res_model', 'res_id')
     def _compute_res_name(self):
-        """Compute the name of the source record"""
+        """Compute the name of the source record, reading each source model once"""
+        logs_by_model = defaultdict(list)
         for log in self:
             if log.res_model and log.res_id:
-                try:
-                    record = self.env[log.res_model].browse(log.res_id)
-                    if record.exists():
-                        log.res_name = record.display_name
-                    else:
-                        log.res_name = _('Deleted Record')
-                except Exception:
-                    log.res_name = _('Invalid Record')
+                logs_by_model[log.res_model].append(log)
             else:
                 log.res_name = ''
+        
+        for res_model, logs in logs_by_model.items():
+            if res_model not in self.env:
+                for log in logs:
+                    log.res_name = _('Invalid Record')
+                continue
+            try:
+                records = self.env[res_model].browse({log.res_id for log in logs}).exists()
+                names = dict(zip(records.ids, records.mapped('display_name')))
+            except AccessError:
+                for log in logs:
+                    log.res_name = _('Invalid Record')
+                continue
+            for log in logs:
+                log.res_name = names.get(log.res_id, _('Deleted Record'))
     
     def action_view_source_record(self):
         """Action to view the source record"""
@@ -60,15 +127,44 @@ class WhatsAppGatewayLog(models.Model):
             'target': 'current',
         }
     
+    def _reset_stale_retries(self):
+        """
+        Set back to error the retrying logs whose retry job will not run
+        
+        A retry job that failed, was cancelled or was removed never updates
+        its logs, which could then not be retried anymore. This corrects the
+        state of the jobs, so it also runs for users who cannot write logs.
+        """
+        retrying = self.filtered(lambda log: log.status == 'retrying')
+        if not retrying:
+            return
+        pending_uuids = set(self.env['queue.job'].sudo().search([
+            ('uuid', 'in', [uuid for uuid in retrying.mapped('retry_job_uuid') if uuid]),
+            ('state', 'not in', ('failed', 'cancelled')),
+        ]).mapped('uuid'))
+        stale = retrying.filtered(lambda log: log.retry_job_uuid not in pending_uuids)
+        if stale:
+            stale.sudo().write({'status': 'error', 'retry_job_uuid': False})
+    
     def action_retry_send(self):
         """Retry sending the message"""
-        if self.status == 'success':
+        self._reset_stale_retries()
+        if self.status == 'retrying':
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'message': _('Message is already queued for retry'),
+                    'type': 'warning',
+                }
+            }
+        if self.status != 'error':
             return
         
         gateway = self.gateway_id
         if gateway and gateway.active:
             # Enqueue the message again
-            gateway.with_delay().send_whatsapp_async(
+            gateway._with_delay().send_whatsapp_async(
                 self.message,
                 self.phone_number,
                 self.res_model,
@@ -90,4 +186,55 @@ class WhatsAppGatewayLog(models.Model):
                     'message': _('Gateway is not active or does not exist'),
                     'type': 'warning',
                 }
-            }
\ No newline at end of file
+            }
+    
+    def action_retry_send_multi(self):
+        """
+        Retry the selected failed messages with one batched job per gateway
+        and number of previous retries
+        
+        Each job is delayed exponentially on the number of previous retries
+        of its messages, and the logs are marked as retrying so that repeated
+        clicks do not queue them twice, until their job fails. Messages that
+        were already retried as many times as the gateway job retries are
+        left failed.
+        """
+        self._reset_stale_retries()
+        failed = self.filtered(lambda log: log.status == 'error' and log.gateway_id.active)
+        logs = failed.filtered(lambda log: log.retry_count < log.gateway_id._job_max_retries)
+        if not logs:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'message': _('No failed message to retry on an active gateway'),
+                    'type': 'warning',
+                }
+            }
+        
+        for (gateway, retry_count), batch_logs in logs.grouped(
+                lambda log: (log.gateway_id, log.retry_count)).items():
+            job = gateway._with_delay(eta=10 * 2 ** retry_count).send_whatsapp_batch([{
+                'message': log.message,
+                'phone_number': log.phone_number,
+                'model': log.res_model,
+                'res_id': log.res_id,
+                'log_id': log.id,
+            } for log in batch_logs])
+            batch_logs.write({
+                'status': 'retrying',
+                'retry_count': retry_count + 1,
+                'retry_job_uuid': job.uuid,
+            })
+        
+        message = _('%s messages queued for retry') % len(logs)
+        if failed - logs:
+            message += ', ' + _('%s reached the retry limit') % len(failed - logs)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': message,
+                'type': 'success',
+            }
+        }
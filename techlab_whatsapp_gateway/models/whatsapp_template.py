@@ -1,7 +1,125 @@
+import functools
 import re
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError, ValidationError
 
+# ${...} placeholders, capturing their content
+_PLACEHOLDER_RE = re.compile(r'\$\{([^}]+)\}')
+# Roots a placeholder content may start with
+_PLACEHOLDER_PREFIX_RE = re.compile(r'(object|user|company)\.')
+# Same spans as _PLACEHOLDER_RE, capturing the root of valid placeholders
+# and an empty string for the invalid ones
+_VALID_PLACEHOLDER_RE = re.compile(r'\$\{(?:((?:object|user|company)\.)[^}]*|[^}]+)\}')
+
+
+# Error label of each placeholder root
+_ROOT_LABELS = {
+    'object': 'Field',
+    'user': 'User field',
+    'company': 'Company field',
+}
+# Marks an attribute missing on the walked record
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_placeholder(placeholder):
+    """
+    Split a placeholder into its root and attribute path
+    
+    Args:
+        placeholder: Placeholder string like 'object.partner_id.name'
+        
+    Returns:
+        tuple: (root, path), the path being an empty tuple for a bare root
+    """
+    root, separator, path = placeholder.partition('.')
+    return root, (tuple(path.split('.')) if separator else ())
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_body(body):
+    """
+    Split a template body into literal segments and compiled placeholders
+    
+    Parsing only depends on the body, so it is cached for the whole process
+    and shared by all databases and templates with the same body.
+    
+    Args:
+        body: Template content with placeholders
+        
+    Returns:
+        tuple: (literals, placeholders) where the placeholders, as
+        (placeholder, root, path), go between consecutive literals
+    """
+    parts = _PLACEHOLDER_RE.split(body)
+    literals = tuple(parts[0::2])
+    placeholders = tuple(
+        (placeholder, *_compile_placeholder(placeholder))
+        for placeholder in parts[1::2]
+    )
+    return literals, placeholders
+
+
+def _resolve_value(root, path, roots):
+    """
+    Resolve a compiled placeholder to its value
+    
+    Args:
+        root: Placeholder root, 'object', 'user' or 'company'
+        path: Attribute names to walk from the root record
+        roots: Record for each placeholder root
+        
+    Returns:
+        tuple: (value, error), error being None or the reason the
+        placeholder could not be resolved
+    """
+    current = roots.get(root, _MISSING)
+    if current is _MISSING:
+        return None, f'Unknown placeholder root: {root}'
+    for part in path:
+        current = getattr(current, part, _MISSING)
+        if current is _MISSING:
+            return None, f'{_ROOT_LABELS[root]} {part} not found'
+        # Handle None values
+        if current is None:
+            return None, None
+    return current, None
+
+
+def _render(literals, placeholders, roots):
+    """
+    Render a parsed template body
+    
+    Placeholders that cannot be resolved are rendered as an error in place,
+    other placeholders are still rendered.
+    
+    Args:
+        literals: Literal segments of the body
+        placeholders: Compiled placeholders going between the literals
+        roots: Record for each placeholder root
+        
+    Returns:
+        str: Rendered content
+    """
+    # Resolve each distinct placeholder once
+    values = {}
+    parts = [literals[0]]
+    for (placeholder, root, path), literal in zip(placeholders, literals[1:]):
+        if placeholder not in values:
+            try:
+                value, error = _resolve_value(root, path, roots)
+                if error:
+                    values[placeholder] = f'[Error: {error}]'
+                else:
+                    values[placeholder] = str(value) if value is not None else ''
+            except Exception as e:
+                # Errors of the ORM, e.g. access errors or expected singletons
+                values[placeholder] = f'[Error: {str(e)}]'
+        parts.append(values[placeholder])
+        parts.append(literal)
+    return ''.join(parts)
+
 
 class WhatsAppTemplate(models.Model):
     """WhatsApp Message Template"""
@@ -51,42 +169,60 @@ class WhatsAppTemplate(models.Model):
         """Compute available field placeholders for the model"""
         for template in self:
             if template.model_id:
-                model = self.env[template.model_id.model]
-                fields_info = []
-                
-                # Get model fields
-                for field_name, field in model._fields.items():
-                    if field.type in ['char', 'text', 'html', 'selection', 'boolean', 
-                                     'integer', 'float', 'monetary', 'date', 'datetime']:
-                        fields_info.append(f"${{object.{field_name}}} - {field.string}")
-                    elif field.type == 'many2one':
-                        fields_info.append(f"${{object.{field_name}.name}} - {field.string}")
-                
-                # Add common computed fields
-                fields_info.extend([
-                    "${object.display_name} - Display Name",
-                    "${object.create_date} - Creation Date",
-                    "${object.write_date} - Last Update",
-                    "${user.name} - Current User Name",
-                    "${company.name} - Company Name",
-                ])
-                
-                template.field_placeholders = '\n'.join(sorted(fields_info))
+                template.field_placeholders = self._field_placeholders_for_model(template.model_id.model)
             else:
                 template.field_placeholders = ''
     
+    @api.model
+    @tools.ormcache('model_name')
+    def _field_placeholders_for_model(self, model_name):
+        """
+        List the field placeholders available for a model, computed once per model
+        
+        Args:
+            model_name: Technical name of the model
+            
+        Returns:
+            str: One placeholder with its description per line
+        """
+        model = self.env[model_name]
+        fields_info = []
+        
+        # Get model fields
+        for field_name, field in model._fields.items():
+            if field.type in ['char', 'text', 'html', 'selection', 'boolean', 
+                             'integer', 'float', 'monetary', 'date', 'datetime']:
+                fields_info.append(f"${{object.{field_name}}} - {field.string}")
+            elif field.type == 'many2one':
+                fields_info.append(f"${{object.{field_name}.name}} - {field.string}")
+        
+        # Add common computed fields
+        fields_info.extend([
+            "${object.display_name} - Display Name",
+            "${object.create_date} - Creation Date",
+            "${object.write_date} - Last Update",
+            "${user.name} - Current User Name",
+            "${company.name} - Company Name",
+        ])
+        
+        return '\n'.join(sorted(fields_info))
+    
     @api.depends('body', 'model_id')
     def _compute_preview_text(self):
         """Generate a preview of the template with sample data"""
+        # Sample record per model, shared by the templates of the same model
+        samples = {}
         for template in self:
             if template.body and template.model_id:
                 try:
                     # Create a sample object for preview
-                    model = self.env[template.model_id.model]
-                    sample_record = model.search([], limit=1)
+                    model_name = template.model_id.model
+                    if model_name not in samples:
+                        samples[model_name] = self.env[model_name].search([], limit=1)
+                    sample_record = samples[model_name]
                     
                     if sample_record:
-                        preview = template._render_template_content(template.body, sample_record)
+                        preview = template._render_template_unchecked(sample_record)
                         template.preview_text = f"<p><strong>Preview with {sample_record.display_name}:</strong></p><p>{preview}</p>"
                     else:
                         template.preview_text = "<p><em>No sample record available for preview</em></p>"
@@ -100,12 +236,15 @@ class WhatsAppTemplate(models.Model):
         """Validate template syntax"""
         for template in self:
             if template.body:
+                # Fast path: every placeholder has a valid root
+                if '' not in _VALID_PLACEHOLDER_RE.findall(template.body):
+                    continue
+                
                 # Check for basic syntax errors in placeholders
-                placeholders = re.findall(r'\$\{[^}]+\}', template.body)
-                for placeholder in placeholders:
-                    # Basic validation - should contain object.
-                    if not placeholder.startswith('${object.') and not placeholder.startswith('${user.') and not placeholder.startswith('${company.'):
-                        raise ValidationError(_('Invalid placeholder: %s. Use ${object.field_name}, ${user.field_name}, or ${company.field_name}') % placeholder)
+                for match in _PLACEHOLDER_RE.finditer(template.body):
+                    # Basic validation - should start with object., user. or company.
+                    if not _PLACEHOLDER_PREFIX_RE.match(match.group(1)):
+                        raise ValidationError(_('Invalid placeholder: %s. Use ${object.field_name}, ${user.field_name}, or ${company.field_name}') % match.group(0))
     
     def render_template(self, record):
         """
@@ -123,6 +262,21 @@ class WhatsAppTemplate(models.Model):
         if record._name != self.model_name:
             raise UserError(_('Template is for model %s, but record is from %s') % (self.model_name, record._name))
         
+        return self._render_template_unchecked(record)
+    
+    def _render_template_unchecked(self, record):
+        """
+        Render template with record data, skipping the guards of render_template
+        
+        For internal callers that already ensure the record is set and belongs
+        to the template model, e.g. a sample record searched on that model.
+        
+        Args:
+            record: Odoo record of the template model
+            
+        Returns:
+            str: Rendered message content
+        """
         return self._render_template_content(self.body, record)
     
     def _render_template_content(self, content, record):
@@ -139,71 +293,28 @@ class WhatsAppTemplate(models.Model):
         if not content:
             return ''
         
-        rendered = content
-        
-        # Find all placeholders
-        placeholders = re.findall(r'\$\{([^}]+)\}', content)
-        
-        for placeholder in placeholders:
-            try:
-                value = self._resolve_placeholder(placeholder, record)
-                rendered = rendered.replace('${%s}' % placeholder, str(value) if value is not None else '')
-            except Exception as e:
-                # Log the error but continue with other placeholders
-                rendered = rendered.replace('${%s}' % placeholder, f'[Error: {str(e)}]')
+        # Plain text needs neither parsing nor cache lookup
+        if '${' not in content:
+            return content
         
-        return rendered
+        literals, placeholders = _parse_body(content)
+        return _render(literals, placeholders, self._placeholder_roots(record))
     
-    def _resolve_placeholder(self, placeholder, record):
+    def _placeholder_roots(self, record):
         """
-        Resolve a single placeholder to its value
+        Records the placeholder roots resolve to
         
         Args:
-            placeholder: Placeholder string like 'object.name'
             record: Odoo record
             
         Returns:
-            Value of the placeholder
+            dict: Record for each placeholder root
         """
-        parts = placeholder.split('.')
-        
-        if parts[0] == 'object':
-            # Navigate through the object fields
-            current = record
-            for part in parts[1:]:
-                if hasattr(current, part):
-                    current = getattr(current, part)
-                else:
-                    raise ValueError(f'Field {part} not found')
-                    
-                # Handle None values
-                if current is None:
-                    return ''
-                    
-            return current
-            
-        elif parts[0] == 'user':
-            # Current user fields
-            current = self.env.user
-            for part in parts[1:]:
-                if hasattr(current, part):
-                    current = getattr(current, part)
-                else:
-                    raise ValueError(f'User field {part} not found')
-            return current
-            
-        elif parts[0] == 'company':
-            # Company fields
-            current = self.env.company
-            for part in parts[1:]:
-                if hasattr(current, part):
-                    current = getattr(current, part)
-                else:
-                    raise ValueError(f'Company field {part} not found')
-            return current
-            
-        else:
-            raise ValueError(f'Unknown placeholder root: {parts[0]}')
+        return {
+            'object': record,
+            'user': self.env.user,
+            'company': self.env.company,
+        }
     
     def action_test_template(self):
         """Action to test template rendering"""
@@ -218,7 +329,7 @@ class WhatsAppTemplate(models.Model):
             raise UserError(_('No records found in model %s to test with') % self.model_id.name)
         
         try:
-            rendered = self.render_template(sample_record)
+            rendered = self._render_template_unchecked(sample_record)
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
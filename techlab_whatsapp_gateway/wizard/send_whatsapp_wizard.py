@@ -1,5 +1,7 @@
-from odoo import models, fields, api, _
-from odoo.exceptions import UserError
+import re
+from collections import defaultdict
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import AccessError, UserError
 
 
 class WhatsAppSendWizard(models.TransientModel):
@@ -18,7 +20,8 @@ class WhatsAppSendWizard(models.TransientModel):
     message = fields.Text(string='Message', required=True,
                          help='The message content to send')
     phone_number = fields.Char(string='Phone Number', required=True,
-                              help='Recipient phone number (with country code)')
+                              help='Recipient phone number (with country code). '
+                                   'Separate several numbers with commas to send in bulk')
     
     # Source record context (when called from a record)
     res_model = fields.Char(string='Source Model')
@@ -31,42 +34,65 @@ class WhatsAppSendWizard(models.TransientModel):
     
     @api.depends('res_model', 'res_id')
     def _compute_res_name(self):
-        """Compute the name of the source record"""
+        """Compute the name of the source record, reading each source model once"""
+        wizards_by_model = defaultdict(list)
         for wizard in self:
             if wizard.res_model and wizard.res_id:
-                try:
-                    record = self.env[wizard.res_model].browse(wizard.res_id)
-                    if record.exists():
-                        wizard.res_name = record.display_name
-                    else:
-                        wizard.res_name = _('Deleted Record')
-                except Exception:
-                    wizard.res_name = _('Invalid Record')
+                wizards_by_model[wizard.res_model].append(wizard)
             else:
                 wizard.res_name = ''
+        
+        for res_model, wizards in wizards_by_model.items():
+            if res_model not in self.env:
+                for wizard in wizards:
+                    wizard.res_name = _('Invalid Record')
+                continue
+            try:
+                records = self.env[res_model].browse({wizard.res_id for wizard in wizards}).exists()
+                names = {record['id']: record['display_name'] for record in records.read(['display_name'])}
+            except AccessError:
+                for wizard in wizards:
+                    wizard.res_name = _('Invalid Record')
+                continue
+            for wizard in wizards:
+                wizard.res_name = names.get(wizard.res_id, _('Deleted Record'))
     
     @api.depends('template_id')
     def _compute_show_template_fields(self):
         """Show template-related fields when template is selected"""
-        for wizard in self:
-            wizard.show_template_fields = bool(wizard.template_id)
+        with_template = self.filtered('template_id')
+        with_template.show_template_fields = True
+        (self - with_template).show_template_fields = False
     
     @api.depends('template_id', 'res_model', 'res_id')
     def _compute_template_preview(self):
-        """Generate template preview"""
+        """Generate template preview, checking the source records of each model at once"""
+        wizards_by_model = defaultdict(list)
         for wizard in self:
             if wizard.template_id and wizard.res_model and wizard.res_id:
+                wizards_by_model[wizard.res_model].append(wizard)
+            else:
+                wizard.template_preview = ""
+        
+        for res_model, wizards in wizards_by_model.items():
+            try:
+                records = self.env[res_model].browse({wizard.res_id for wizard in wizards}).exists()
+            except Exception as e:
+                for wizard in wizards:
+                    wizard.template_preview = f"<p><em>Preview error: {str(e)}</em></p>"
+                continue
+            records_by_id = {record.id: record for record in records}
+            
+            for wizard in wizards:
+                record = records_by_id.get(wizard.res_id)
+                if not record:
+                    wizard.template_preview = "<p><em>No record available for preview</em></p>"
+                    continue
                 try:
-                    record = self.env[wizard.res_model].browse(wizard.res_id)
-                    if record.exists():
-                        rendered = wizard.template_id.render_template(record)
-                        wizard.template_preview = f"<p><strong>Template Preview:</strong></p><p>{rendered}</p>"
-                    else:
-                        wizard.template_preview = "<p><em>No record available for preview</em></p>"
+                    rendered = wizard.template_id.render_template(record)
+                    wizard.template_preview = f"<p><strong>Template Preview:</strong></p><p>{rendered}</p>"
                 except Exception as e:
                     wizard.template_preview = f"<p><em>Preview error: {str(e)}</em></p>"
-            else:
-                wizard.template_preview = ""
     
     @api.model
     def default_get(self, fields_list):
@@ -85,12 +111,15 @@ class WhatsAppSendWizard(models.TransientModel):
             try:
                 record = self.env[context['active_model']].browse(context['active_id'])
                 if record.exists():
-                    # Look for common phone fields
-                    phone_fields = ['mobile', 'phone', 'phone_number', 'whatsapp_number']
-                    for field in phone_fields:
-                        if hasattr(record, field) and getattr(record, field):
-                            defaults['phone_number'] = getattr(record, field)
-                            break
+                    # Look for common phone fields, read in one go
+                    phone_fields = [field for field in ('mobile', 'phone', 'phone_number', 'whatsapp_number')
+                                    if field in record._fields]
+                    if phone_fields:
+                        values = record.read(phone_fields)[0]
+                        for field in phone_fields:
+                            if values[field]:
+                                defaults['phone_number'] = values[field]
+                                break
             except Exception:
                 pass
         
@@ -107,22 +136,25 @@ class WhatsAppSendWizard(models.TransientModel):
     @api.onchange('template_id')
     def _onchange_template_id(self):
         """Update message content when template changes"""
-        if self.template_id:
-            # Set default gateway from template if not already set
-            if self.template_id.gateway_id and not self.gateway_id:
-                self.gateway_id = self.template_id.gateway_id
-            
-            # Render template if we have a source record
-            if self.res_model and self.res_id:
-                try:
-                    record = self.env[self.res_model].browse(self.res_id)
-                    if record.exists():
-                        self.message = self.template_id.render_template(record)
-                except Exception as e:
-                    self.message = f"Template error: {str(e)}"
-            else:
-                # Use template body as-is if no record context
-                self.message = self.template_id.body
+        if not self.template_id:
+            return
+        
+        # Set default gateway from template if not already set
+        if self.template_id.gateway_id and not self.gateway_id:
+            self.gateway_id = self.template_id.gateway_id
+        
+        if not (self.res_model and self.res_id):
+            # Use template body as-is if no record context
+            self.message = self.template_id.body
+            return
+        
+        # Render template with the source record, from the cached body parse
+        try:
+            record = self.env[self.res_model].browse(self.res_id)
+            if record.exists():
+                self.message = self.template_id.render_template(record)
+        except Exception as e:
+            self.message = f"Template error: {str(e)}"
     
     @api.onchange('gateway_id', 'template_id')
     def _onchange_gateway_template_compatibility(self):
@@ -134,12 +166,18 @@ class WhatsAppSendWizard(models.TransientModel):
                     'warning': {
                         'title': _('Gateway/Template Mismatch'),
                         'message': _('The selected template is designed for %s gateways, but you selected a %s gateway.') % (
-                            dict(self.template_id._fields['gateway_type'].selection)[self.template_id.gateway_type],
-                            dict(self.gateway_id._fields['type'].selection)[self.gateway_id.type]
+                            self._gateway_type_labels('whatsapp.template', 'gateway_type')[self.template_id.gateway_type],
+                            self._gateway_type_labels('whatsapp.gateway', 'type')[self.gateway_id.type]
                         )
                     }
                 }
     
+    @api.model
+    @tools.ormcache('model_name', 'field_name')
+    def _gateway_type_labels(self, model_name, field_name):
+        """Labels of a static gateway type selection field, by value"""
+        return dict(self.env[model_name]._fields[field_name].selection)
+    
     def action_send_message(self):
         """Send the WhatsApp message"""
         self.ensure_one()
@@ -150,9 +188,13 @@ class WhatsAppSendWizard(models.TransientModel):
         if not self.phone_number.strip():
             raise UserError(_('Phone number is required'))
         
+        recipients = self._get_recipients()
+        if len(recipients) > 1:
+            return self._send_bulk_message(recipients)
+        
         try:
             # Queue the message for asynchronous sending
-            job = self.gateway_id.with_delay().send_whatsapp_async(
+            job = self.gateway_id._with_delay().send_whatsapp_async(
                 message=self.message,
                 phone_number=self.phone_number,
                 model=self.res_model,
@@ -174,6 +216,35 @@ class WhatsAppSendWizard(models.TransientModel):
         except Exception as e:
             raise UserError(_('Failed to queue message: %s') % str(e))
     
+    def _get_recipients(self):
+        """Split the phone number field into the individual recipients"""
+        return [phone.strip() for phone in re.split(r'[,;\n]', self.phone_number) if phone.strip()]
+    
+    def _send_bulk_message(self, recipients):
+        """Queue the message for several recipients in batched jobs"""
+        messages = [{
+            'message': self.message,
+            'phone_number': phone_number,
+            'model': self.res_model,
+            'res_id': self.res_id,
+        } for phone_number in recipients]
+        
+        try:
+            jobs = self.gateway_id._enqueue_whatsapp_batches(messages)
+        except Exception as e:
+            raise UserError(_('Failed to queue message: %s') % str(e))
+        
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Messages Queued'),
+                'message': _('%s WhatsApp messages have been queued for sending in %s jobs.') % (len(messages), len(jobs)),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+    
     def action_preview_message(self):
         """Preview the message content"""
         self.ensure_one()
@@ -204,7 +275,7 @@ class WhatsAppSendWizard(models.TransientModel):
         test_message = "Test message from Odoo WhatsApp Gateway"
         
         try:
-            job = self.gateway_id.with_delay().send_whatsapp_async(
+            job = self.gateway_id._with_delay().send_whatsapp_async(
                 message=test_message,
                 phone_number=self.phone_number,
                 model=None,